@@ -1,19 +1,42 @@
 import json
 import os
+from urllib.request import urlopen
+import networkx as nx
 from pyspark.sql import SparkSession, Row
 from pyspark.sql.types import StringType
-from pyspark.sql.functions import col, concat, count, lower, udf, first, element_at, collect_list
-from GraphHelper import GraphGenerator
-
-def greater_rarity(rarity1, rarity2):
-	"""is rarity1 more rare than rarity2?"""
-	rarities = ["common", "uncommon", "rare", "mythic", "special", "bonus", None]
-	return rarities.index(rarity1) > rarities.index(rarity2)
+from pyspark.sql.functions import col, concat, count, lower, udf, first, element_at, collect_list, \
+	to_date, date_format, regexp_extract, countDistinct, lit, when
+from GraphHelper import GraphGenerator, BucketedRelevance, greater_rarity
+from Instrumentation import RunReport
 
 class CardRelevanceSparkJob:
 
-	def __init__(self):
-		self.spark = SparkSession.builder.config("spark.driver.memory", "15g").appName("mtg_analysis").getOrCreate()
+	def __init__(self, report=None):
+		self.report = report if report else RunReport("relevance_spark_job")
+		self.spark = SparkSession.builder.config("spark.driver.memory", "15g") \
+			.config("spark.executor.processTreeMetrics.enabled", "true") \
+			.appName("mtg_analysis").getOrCreate()
+
+	def jvm_memory(self):
+		"""Memory sampler for spark stages: peak JVM memory across the driver and
+		executors, from spark's monitoring REST API. Peaks are only refreshed on
+		executor heartbeats, so short stages may not see their own peak."""
+		sc = self.spark.sparkContext
+		if(not sc.uiWebUrl):
+			return {}
+		url = "%s/api/v1/applications/%s/executors" % (sc.uiWebUrl, sc.applicationId)
+		try:
+			with urlopen(url, timeout=5) as response:
+				executors = json.load(response)
+		except (OSError, ValueError):
+			return {}
+
+		peaks = {}
+		for e in executors:
+			for metric, value in (e.get("peakMemoryMetrics") or {}).items():
+				peaks[metric] = max(peaks.get(metric, 0), value)
+		metrics = ["JVMHeapMemory", "JVMOffHeapMemory", "ProcessTreeJVMRSSMemory"]
+		return {"jvm_peak_" + m: peaks[m] for m in metrics if m in peaks}
 
 	@staticmethod
 	def min_rarity(rarity_strings):
@@ -29,19 +52,11 @@ class CardRelevanceSparkJob:
 
 		return min_rarity
 
-	def run_job(
-		self, 
-		decklist_db_fname,
-		scryfall_cards_fname,
-		relevance_json_fname
-	):
-		print('Reading data decklists data')
-		decklist_cards_df = self.spark.read.json(decklist_db_fname, multiLine=True)
-
-		print('Reading scryfall data...')
-		scryfall_cards_fname = 'default-cards-20221203100453.json'
-		scryfall_df = self.spark.read.json(scryfall_cards_fname) \
-			.withColumn("scryfall_id", concat(col("set"), col("collector_number")))
+	def read_scryfall(self, scryfall_cards_fname):
+		with self.report.stage("read_scryfall", memory_sampler=self.jvm_memory):
+			print('Reading scryfall data...')
+			scryfall_df = self.spark.read.json(scryfall_cards_fname) \
+				.withColumn("scryfall_id", concat(col("set"), col("collector_number")))
 
 		min_rarity_udf = udf(CardRelevanceSparkJob.min_rarity, StringType())
 
@@ -55,6 +70,104 @@ class CardRelevanceSparkJob:
 			first("image_uri").alias("image_uri"),
 			first("colors").alias("colors")
 		)
+		return cleaned_scryfall_df
+
+	@staticmethod
+	def with_event_month(decklist_cards_df):
+		"""Add a yyyy-MM event_month column parsed from mtgtop8's dd/mm/yy event dates.
+
+		Unparsable dates and missing formats go into the unknown bucket.
+		"""
+		event_day = to_date(regexp_extract(col("event_date"), r"[0-9]{2}/[0-9]{2}/[0-9]{2}", 0), "dd/MM/yy")
+		return decklist_cards_df.withColumn(
+			"event_month", date_format(event_day, "yyyy-MM")
+		).fillna(
+			BucketedRelevance.unknown_bucket, subset=["event_month", "decklist_format"]
+		)
+
+	def run_bucketed_job(
+		self,
+		decklist_db_fname,
+		scryfall_cards_fname,
+		buckets_dirname
+	):
+		"""Count co-occurrences per (format, month) bucket.
+
+		Every decklist falls into exactly one bucket, so summing the bucket
+		counts for any set of formats and months gives the same co_counts
+		and card counts as running run_job over just those decklists.
+		Only name_1 < name_2 pairs are written; BucketedRelevance mirrors them.
+
+		Decklists scraped before the scraper recorded letter format codes
+		have no decklist_format and are counted in the unknown format bucket.
+		"""
+		with self.report.stage("read_decklists", memory_sampler=self.jvm_memory):
+			print('Reading data decklists data')
+			decklist_cards_df = CardRelevanceSparkJob.with_event_month(
+				self.spark.read.json(decklist_db_fname, multiLine=True)
+			).select("name", "decklist_id", "decklist_format", "event_month").distinct().persist()
+			# one pass, which also fills the cache the self-join reads from
+			row_counts = decklist_cards_df.agg(
+				count(lit(1)).alias("rows"),
+				count(when(col("decklist_format") == BucketedRelevance.unknown_bucket, True)).alias("unknown_format_rows")
+			).first()
+			self.report.count("bucketed_card_rows_parsed", row_counts["rows"])
+			self.report.count("unknown_format_card_rows", row_counts["unknown_format_rows"])
+
+		cleaned_scryfall_df = self.read_scryfall(scryfall_cards_fname)
+
+		print('Counting bucketed card co-occurrences')
+		bucketed_card_counts_df = decklist_cards_df.groupby(
+			"decklist_format", "event_month", "name"
+		).count()
+
+		bucketed_decklist_counts_df = decklist_cards_df.groupby(
+			"decklist_format", "event_month"
+		).agg(countDistinct("decklist_id").alias("count"))
+
+		bucketed_co_counts_df = decklist_cards_df.alias("dc1").join(
+			decklist_cards_df.select("name", "decklist_id").alias("dc2"),
+			(col("dc1.decklist_id") == col("dc2.decklist_id")) & (col("dc1.name") < col("dc2.name"))
+		).groupby(
+			col("dc1.decklist_format").alias("decklist_format"),
+			col("dc1.event_month").alias("event_month"),
+			col("dc1.name").alias("name_1"),
+			col("dc2.name").alias("name_2")
+		).count().withColumnRenamed(
+			"count", "co_counts"
+		)
+
+		# spark is lazy, so the self-join above runs in this stage
+		with self.report.stage("write_buckets", memory_sampler=self.jvm_memory):
+			print('Writing bucketed counts')
+			co_counts_dirname = os.path.join(buckets_dirname, BucketedRelevance.co_counts_dirname)
+			card_counts_dirname = os.path.join(buckets_dirname, BucketedRelevance.card_counts_dirname)
+			decklist_counts_dirname = os.path.join(buckets_dirname, BucketedRelevance.decklist_counts_dirname)
+			cards_dirname = os.path.join(buckets_dirname, BucketedRelevance.cards_dirname)
+			bucketed_co_counts_df.write.json(co_counts_dirname)
+			bucketed_card_counts_df.write.json(card_counts_dirname)
+			bucketed_decklist_counts_df.write.json(decklist_counts_dirname)
+			bucketed_card_counts_df.select("name").distinct().join(
+				cleaned_scryfall_df, "name", "left"
+			).select("name", "rarity", "colors").write.json(cards_dirname)
+			for dirname in [co_counts_dirname, card_counts_dirname, decklist_counts_dirname, cards_dirname]:
+				self.report.count("bytes_written", CardRelevanceSparkJob._dir_size(dirname))
+		decklist_cards_df.unpersist()
+
+	def run_job(
+		self, 
+		decklist_db_fname,
+		scryfall_cards_fname,
+		relevance_json_fname
+	):
+		with self.report.stage("read_decklists", memory_sampler=self.jvm_memory):
+			print('Reading data decklists data')
+			decklist_cards_df = self.spark.read.json(decklist_db_fname, multiLine=True).persist()
+			# also fills the cache, so the decklists are parsed once
+			self.report.count("card_rows_parsed", decklist_cards_df.count())
+
+		scryfall_cards_fname = 'default-cards-20221203100453.json'
+		cleaned_scryfall_df = self.read_scryfall(scryfall_cards_fname)
 
 		print('Counting card co-occurrences')
 		## Get card relevance scores
@@ -111,25 +224,63 @@ class CardRelevanceSparkJob:
 			col("sf1.colors").alias("colors_1"), col("sf2.colors").alias("colors_2")
 		).distinct()
 
-		print('Writing relevance data')
-		enriched_co_count_ratios_df.write.json(relevance_json_fname)
+		# spark is lazy, so the joins and aggregations above all run in this stage
+		with self.report.stage("write_relevance", memory_sampler=self.jvm_memory):
+			print('Writing relevance data')
+			enriched_co_count_ratios_df.write.json(relevance_json_fname)
+			self.report.count("bytes_written", CardRelevanceSparkJob._dir_size(relevance_json_fname))
+		decklist_cards_df.unpersist()
+
+	@staticmethod
+	def _dir_size(path):
+		return sum([os.path.getsize(os.path.join(path, f)) for f in os.listdir(path)])
 
 if(__name__ == "__main__"):
 	decklist_db_fname='decklist_card_keyed/decklist_card_keyed*.json'
 	scryfall_cards_fname = 'default-cards-20221203100453.json'
 	relevance_json_fname = "relevance_scores_symmetrical.json"
+	buckets_dirname = "relevance_buckets"
+	# the global graph is summed from the buckets; set this to also write
+	# the enriched relevance_json_fname, at the cost of a second self-join
+	run_global_job = False
 
-	print('Starting relevance spark job...')
-	job = CardRelevanceSparkJob()
-	job.run_job(decklist_db_fname,
-		scryfall_cards_fname,
-		relevance_json_fname
-	)
-
-	print('Generating graph...')
-	g = GraphGenerator.get_nx_graph("relevance_scores_symmetrical.json/", 100, 0.05, "mythic")
-	json_graph = nx.node_link_data(g)
-	print('Writing generated graph...')
-	with open("relevance_graph.json",'w') as f:
-		json.dump(json_graph, f)
-	print('Written!')
\ No newline at end of file
+	report_fname = "run_report.jsonl"
+
+	report = RunReport("relevance_pipeline")
+	try:
+		job = CardRelevanceSparkJob(report=report)
+		if(run_global_job):
+			print('Starting relevance spark job...')
+			job.run_job(decklist_db_fname,
+				scryfall_cards_fname,
+				relevance_json_fname
+			)
+
+		print('Starting bucketed relevance spark job...')
+		job.run_bucketed_job(decklist_db_fname,
+			scryfall_cards_fname,
+			buckets_dirname
+		)
+
+		print('Generating graph...')
+		with report.stage("build_graph"):
+			buckets = BucketedRelevance.from_json(buckets_dirname, report=report)
+			g = buckets.get_nx_graph(
+				GraphGenerator.default_min_count,
+				GraphGenerator.default_min_weight,
+				GraphGenerator.default_max_rarity,
+				report=report
+			)
+		json_graph = nx.node_link_data(g)
+		print('Writing generated graph...')
+		with report.stage("write_graph"):
+			with open("relevance_graph.json",'w') as f:
+				json.dump(json_graph, f)
+				report.count("bytes_written", f.tell())
+		print('Written!')
+	except BaseException as e:
+		report.mark_failed(e)
+		raise
+	finally:
+		# write the report for failed runs too
+		report.writeout(report_fname)
\ No newline at end of file
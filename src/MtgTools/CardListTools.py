@@ -65,10 +65,12 @@ class DecklistDatabase:
             self.db[k] = decklist_object
         self.most_recent_event = self._find_most_recent_event_id()
 
-    def writeout(self, file_loc):
+    def writeout(self, file_loc, report=None):
         DecklistDatabase._validate_fname(file_loc)
         with open(file_loc, 'w') as f:
             json.dump(self.db, f, ensure_ascii=False, indent=4, cls=DataclassAwareJSONEncoder)
+            if(report):
+                report.count("bytes_written", f.tell())
 
     def add_decklists(self, decklists):
         for dl in decklists:
@@ -92,15 +94,18 @@ class DecklistDatabase:
                 cards_list.append(asdict(card_object) | asdict(decklist_object))
         return cards_list
 
-    def writeout_card_json_list(self, file_loc):
+    def writeout_card_json_list(self, file_loc, report=None):
         DecklistDatabase._validate_fname(file_loc)
         db = self.to_card_keyed_json_list()
-        DecklistDatabase._writeout_card_json_list_helper(db, file_loc)
+        DecklistDatabase._writeout_card_json_list_helper(db, file_loc, report)
     
     @staticmethod
-    def _writeout_card_json_list_helper(db, file_loc):
+    def _writeout_card_json_list_helper(db, file_loc, report=None):
         with open(file_loc, 'w') as f:
             json.dump(db, f, ensure_ascii=False, indent=4)
+            if(report):
+                report.count("card_records_written", len(db))
+                report.count("bytes_written", f.tell())
 
     def _chunk_self(self, shard_size):
         it = iter(self.db)
@@ -112,7 +117,7 @@ class DecklistDatabase:
         if(len(fname.split("."))!=2):
             raise Exception("File name %s is invalid!" % fname) 
 
-    def writeout_card_json_shards(self, file_loc, shard_size=10000):
+    def writeout_card_json_shards(self, file_loc, shard_size=10000, report=None):
         DecklistDatabase._validate_fname(file_loc)
         chunks = self._chunk_self(shard_size)
         i = 0
@@ -120,7 +125,9 @@ class DecklistDatabase:
             prefix, suffix = file_loc.split('.')
             fname = prefix + "_" + str(i) + "." + suffix
             this_chunk = DecklistDatabase._to_card_keyed_json_list_helper(dict(c))
-            DecklistDatabase._writeout_card_json_list_helper(this_chunk, fname)
+            DecklistDatabase._writeout_card_json_list_helper(this_chunk, fname, report)
+            if(report):
+                report.count("shards_written")
             i += 1
 
 
@@ -1,6 +1,13 @@
 import json
 import os
+import threading
 import networkx as nx
+from collections import Counter, OrderedDict
+
+def greater_rarity(rarity1, rarity2):
+	"""is rarity1 more rare than rarity2?"""
+	rarities = ["common", "uncommon", "rare", "mythic", "special", "bonus", None]
+	return rarities.index(rarity1) > rarities.index(rarity2)
 
 class GraphGenerator:
 	basic_lands = ["Island", "Forest", "Swamp", "Plains", "Mountain"]
@@ -15,6 +22,11 @@ class GraphGenerator:
 	artifact_lands = ["Seat of the Synod", "Vault of Whispers", "Great Furnance", "Tree of Tales", "Ancient Den",
 	                 "Darksteel Citadel"]
 
+	# thresholds for the published graph, tuned on all formats and years
+	default_min_count = 100
+	default_min_weight = 0.05
+	default_max_rarity = "mythic"
+
 	@classmethod
 	def excluded_cards(cls):
 		return cls.basic_lands + cls.fast_lands + cls.fetch_lands + cls.shock_lands + cls.dual_lands + cls.artifact_lands
@@ -59,7 +71,7 @@ class GraphGenerator:
 			return [0.5, 0.5, 0.5]
 
 	@staticmethod
-	def make_graph_nx(relevance):
+	def make_graph_nx(relevance, report=None):
 		graph = nx.Graph()
 		i = 1
 		for r in relevance:
@@ -73,6 +85,8 @@ class GraphGenerator:
 
 		nx.set_node_attributes(graph, colors, "color")
 		nx.set_node_attributes(graph, rarities, "rarity")
+		if(report):
+			report.count("edges_built", graph.number_of_edges())
 		return graph
 
 	@classmethod
@@ -96,11 +110,15 @@ class GraphGenerator:
 
 
 	@staticmethod
-	def get_nx_graph(filename, min_count, min_weight, max_rarity):
+	def get_nx_graph(filename, min_count, min_weight, max_rarity, report=None):
 		data = GraphGenerator.read_relevance_graph(filename)
+		if(report):
+			report.count("relevance_records_parsed", len(data))
 		data = [r for r in data if GraphGenerator.admissible(r,min_count=min_count,min_weight=min_weight, max_rarity=max_rarity)]
 		print("%d records!" % len(data))
-		return GraphGenerator.make_graph_nx(data)
+		if(report):
+			report.count("relevance_records_admitted", len(data))
+		return GraphGenerator.make_graph_nx(data, report=report)
 
 	@staticmethod
 	def get_subgraph(graph, node, min_weight=0.4, K=2):
@@ -133,4 +151,144 @@ class GraphGenerator:
 				if len(path) > (K+1):
 					graph.remove_node(n)
 			except nx.NetworkXNoPath:
-				graph.remove_node(n) 
\ No newline at end of file
+				graph.remove_node(n)
+
+
+class BucketedRelevance:
+	"""Co-occurrence counts bucketed by (format, month), as written by run_bucketed_job.
+
+	Graphs for any set of formats and window of months are assembled by
+	summing buckets in memory, so no decklists are rescanned.
+	"""
+	co_counts_dirname = "co_counts"
+	card_counts_dirname = "card_counts"
+	decklist_counts_dirname = "decklist_counts"
+	cards_dirname = "cards"
+	unknown_bucket = "unknown"
+	graph_cache_size = 8
+
+	def __init__(self, co_counts, card_counts, decklist_counts, cards):
+		self.co_counts = co_counts
+		self.card_counts = card_counts
+		self.decklist_counts = decklist_counts
+		self.cards = cards
+		self.graph_cache = OrderedDict()
+		# dash may serve callbacks from several threads
+		self.graph_cache_lock = threading.Lock()
+
+	@classmethod
+	def from_json(cls, path_to_buckets, report=None):
+		co_counts = {}
+		co_count_records = GraphGenerator.read_relevance_graph(os.path.join(path_to_buckets, cls.co_counts_dirname, ""))
+		for r in co_count_records:
+			bucket = co_counts.setdefault((r['decklist_format'], r['event_month']), {})
+			bucket[(r['name_1'], r['name_2'])] = r['co_counts']
+
+		card_counts = {}
+		card_count_records = GraphGenerator.read_relevance_graph(os.path.join(path_to_buckets, cls.card_counts_dirname, ""))
+		for r in card_count_records:
+			bucket = card_counts.setdefault((r['decklist_format'], r['event_month']), {})
+			bucket[r['name']] = r['count']
+
+		decklist_counts = {}
+		for r in GraphGenerator.read_relevance_graph(os.path.join(path_to_buckets, cls.decklist_counts_dirname, "")):
+			decklist_counts[(r['decklist_format'], r['event_month'])] = r['count']
+
+		cards = {r['name']: r for r in GraphGenerator.read_relevance_graph(os.path.join(path_to_buckets, cls.cards_dirname, ""))}
+		if(report):
+			report.count("bucket_records_read", len(co_count_records) + len(card_count_records))
+		return cls(co_counts, card_counts, decklist_counts, cards)
+
+	def formats(self):
+		return sorted(set([f for f, m in self.card_counts.keys() if f != self.unknown_bucket]))
+
+	def months(self):
+		return sorted(set([m for f, m in self.card_counts.keys() if m != self.unknown_bucket]))
+
+	@staticmethod
+	def _window(start_month, end_month):
+		if(start_month and end_month and start_month > end_month):
+			return end_month, start_month
+		return start_month, end_month
+
+	def select_buckets(self, formats=None, start_month=None, end_month=None):
+		"""Buckets matching the formats and the inclusive yyyy-MM window; None means no filter"""
+		start_month, end_month = BucketedRelevance._window(start_month, end_month)
+		selected = []
+		for f, m in self.card_counts.keys():
+			# decklists with no recorded format only count towards unfiltered graphs
+			if(formats and (f not in formats or f == self.unknown_bucket)):
+				continue
+			if((start_month or end_month) and m == self.unknown_bucket):
+				continue
+			if(start_month and m < start_month):
+				continue
+			if(end_month and m > end_month):
+				continue
+			selected.append((f, m))
+		return selected
+
+	def scaled_min_count(self, min_count, buckets):
+		"""Scale a min_count tuned on every decklist to the decklists in buckets"""
+		total_decklists = sum(self.decklist_counts.values())
+		if(not total_decklists):
+			return min_count
+		return min_count * sum([self.decklist_counts.get(b, 0) for b in buckets]) / total_decklists
+
+	def relevance_records(self, formats=None, start_month=None, end_month=None, min_count=0, min_weight=0, report=None):
+		"""Sum the selected buckets into records shaped like run_job's relevance output.
+
+		Pairs below min_count or min_weight are dropped before any records are built.
+		"""
+		buckets = self.select_buckets(formats, start_month, end_month)
+		co_counts = Counter()
+		card_counts = Counter()
+		for b in buckets:
+			co_counts.update(self.co_counts.get(b, {}))
+			card_counts.update(self.card_counts.get(b, {}))
+		if(report):
+			report.count("bucket_pairs_summed", len(co_counts))
+
+		relevance = []
+		for (name_1, name_2), co_count in co_counts.items():
+			total_count = card_counts[name_1] + card_counts[name_2]
+			weight = 2*co_count/total_count
+			if(total_count < min_count or weight < min_weight):
+				continue
+			for n1, n2 in [(name_1, name_2), (name_2, name_1)]:
+				r = {
+					'name_1': n1,
+					'name_2': n2,
+					'co_counts': co_count,
+					'card_count': total_count,
+					'relevance': weight,
+					'rarity_1': self.cards.get(n1, {}).get('rarity'),
+					'rarity_2': self.cards.get(n2, {}).get('rarity'),
+					'colors_1': self.cards.get(n1, {}).get('colors'),
+					'colors_2': self.cards.get(n2, {}).get('colors')
+				}
+				# match spark's json output, which leaves out null fields
+				relevance.append({k: v for k, v in r.items() if v is not None})
+		return relevance
+
+	def get_nx_graph(self, min_count, min_weight, max_rarity, formats=None, start_month=None, end_month=None, report=None):
+		"""Graph for the selected buckets, with min_count scaled to their share of all decklists"""
+		start_month, end_month = BucketedRelevance._window(start_month, end_month)
+		key = (tuple(sorted(formats)) if formats else None, start_month, end_month, min_count, min_weight, max_rarity)
+		with self.graph_cache_lock:
+			if(key in self.graph_cache):
+				self.graph_cache.move_to_end(key)
+				return self.graph_cache[key]
+
+		min_count = self.scaled_min_count(min_count, self.select_buckets(formats, start_month, end_month))
+		data = self.relevance_records(formats, start_month, end_month, min_count, min_weight, report)
+		data = [r for r in data if GraphGenerator.admissible(r,min_count=min_count,min_weight=min_weight, max_rarity=max_rarity)]
+		print("%d records!" % len(data))
+		if(report):
+			report.count("relevance_records_admitted", len(data))
+		graph = GraphGenerator.make_graph_nx(data, report=report)
+		with self.graph_cache_lock:
+			self.graph_cache[key] = graph
+			while(len(self.graph_cache) > self.graph_cache_size):
+				self.graph_cache.popitem(last=False)
+		return graph
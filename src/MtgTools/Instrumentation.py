@@ -0,0 +1,92 @@
+import json
+import resource
+import sys
+from contextlib import contextmanager
+from time import time
+
+def peak_rss_bytes():
+	"""Peak resident set size of this python process, in bytes"""
+	peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+	# linux reports kilobytes, macOS reports bytes
+	if(sys.platform == "darwin"):
+		return peak
+	return peak * 1024
+
+def python_memory():
+	"""Memory sampler for stages whose work runs in this python process"""
+	return {"python_peak_rss_bytes": peak_rss_bytes()}
+
+class RunReport:
+	"""Collects stage timings, counters and peak memory for one pipeline run"""
+
+	def __init__(self, run_name="mtg_pipeline"):
+		self.run_name = run_name
+		self.run_start = time()
+		self.counters = {}
+		self.records = []
+		self.error = None
+
+	def count(self, name, n=1):
+		self.counters[name] = self.counters.get(name, 0) + n
+
+	def mark_failed(self, e):
+		"""Record an error raised outside of any stage"""
+		self.error = repr(e)
+
+	@contextmanager
+	def stage(self, name, memory_sampler=python_memory):
+		"""Time a stage; memory_sampler returns peak memory fields and is sampled
+		at the start and end, since peaks only ever grow"""
+		counters_before = dict(self.counters)
+		memory_before = memory_sampler()
+		start = time()
+		status = "succeeded"
+		error = None
+		try:
+			yield self
+		except BaseException as e:
+			status = "failed"
+			error = repr(e)
+			raise
+		finally:
+			elapsed = time() - start
+			stage_counters = {
+				k: v - counters_before.get(k, 0) for k, v in self.counters.items()
+				if v != counters_before.get(k, 0)
+			}
+			record = {
+				"run": self.run_name,
+				"stage": name,
+				"status": status,
+				"start": start,
+				"seconds": elapsed,
+				"memory_start": memory_before,
+				"memory": memory_sampler(),
+				"counters": stage_counters
+			}
+			if(error):
+				record["error"] = error
+			if(elapsed > 0):
+				record["rates"] = {k + "_per_sec": v / elapsed for k, v in stage_counters.items()}
+			self.records.append(record)
+
+	def summary(self):
+		failed = self.error or any([r["status"] == "failed" for r in self.records])
+		record = {
+			"run": self.run_name,
+			"stage": "total",
+			"status": "failed" if failed else "succeeded",
+			"start": self.run_start,
+			"seconds": time() - self.run_start,
+			"memory": python_memory(),
+			"counters": dict(self.counters)
+		}
+		if(self.error):
+			record["error"] = self.error
+		return record
+
+	def writeout(self, file_loc):
+		"""Append one JSON line per stage, plus a run total, to file_loc"""
+		with open(file_loc, 'a') as f:
+			for record in self.records + [self.summary()]:
+				f.write(json.dumps(record) + "\n")
@@ -1,5 +1,6 @@
 from bs4 import BeautifulSoup
 from DecklistDatabase import DecklistDatabase, Decklist, Card
+from Instrumentation import RunReport
 import requests
 from time import sleep, time
 import json
@@ -7,12 +8,13 @@ import re
 
 class MtgTop8Scraper:
   
-  def __init__(self, wait_duration=0.1, timeout_duration=10, verbose=False):
+  def __init__(self, wait_duration=0.1, timeout_duration=10, verbose=False, report=None):
     self.base_url = "https://www.mtgtop8.com/"
     self.formats = []
     self.wait_duration = wait_duration
     self.timeout_duration = timeout_duration
     self.verbose = verbose
+    self.report = report if report else RunReport("mtgtop8_scraper")
 
   def get_decklist_urls(self, event_soup):
     divs = event_soup.find_all("div", {"class": "S14"})
@@ -50,7 +52,7 @@ class MtgTop8Scraper:
 
   @staticmethod
   def _get_decklist_id_and_format_from_url(decklist_url):
-    format_expression = r"f=([0-9]+)"
+    format_expression = r"f=([a-zA-Z0-9]+)" # format codes are letters, e.g. f=MO
     id_expression = r"d=([0-9]+)"
     
     decklist_format = MtgTop8Scraper._pull_regex_group_from_url(decklist_url, format_expression)
@@ -135,8 +137,11 @@ class MtgTop8Scraper:
     while(not MtgTop8Scraper._validate(event_raw)):
       if(self.verbose):
         print("Invalid response. Waiting...")
+      self.report.count("invalid_responses")
       sleep(self.timeout_duration)
       event_raw = requests.get(url)
+    self.report.count("pages_fetched")
+    self.report.count("bytes_fetched", len(event_raw.content))
     return BeautifulSoup(event_raw.content, 'html.parser')
 
   @staticmethod
@@ -157,7 +162,9 @@ class MtgTop8Scraper:
       
       if(not self.event_exists(event_soup)):
         print("Event %d not found!" % event_ind)
+        self.report.count("events_missing")
       else:
+        self.report.count("events_parsed")
         event_metadata = self.get_event_metadata(event_soup, event_url)
         decklist_urls = self.get_decklist_urls(event_soup)
         for decklist_url in decklist_urls:
@@ -165,6 +172,8 @@ class MtgTop8Scraper:
             print("Getting decklist %s" % decklist_url)
           decklist = self.get_decklist(decklist_url).enrich_decklist(event_metadata)
           decklists.append(decklist)
+          self.report.count("decklists_parsed")
+          self.report.count("cards_parsed", len(decklist.decklist))
 
     return decklists
 
@@ -174,25 +183,39 @@ if(__name__=="__main__"):
   scrape_increment = 10 # num events to scrape between saves
   wait_duration = 0.1 # seconds
   database_floc = 'decklist_db.json'
+  report_floc = 'scrape_report.jsonl'
   #starting_event_ind = 1
   ######
 
-  print('Loading...')
-  deck_database = DecklistDatabase()
-  deck_database.load(database_floc)
-  print('Loaded!')
-  starting_event_ind = deck_database.most_recent_event
-  scraper = MtgTop8Scraper(wait_duration=wait_duration, verbose=False)
-
-  print('Starting scraper at event #%d' % starting_event_ind)
-  decklists = scraper.scrape_decks(starting_event_ind, scrape_increment)
-  deck_database.add_decklists(decklists)
-  deck_database.writeout(database_floc)
-  starting_event_ind += scrape_increment
-  while(len(decklists)>0):
-    decklists = scraper.scrape_decks(starting_event_ind, scrape_increment)
+  report = RunReport("mtgtop8_scraper")
+  try:
+    print('Loading...')
+    with report.stage("load_database"):
+      deck_database = DecklistDatabase()
+      deck_database.load(database_floc)
+    print('Loaded!')
+    starting_event_ind = deck_database.most_recent_event
+    scraper = MtgTop8Scraper(wait_duration=wait_duration, verbose=False, report=report)
+
+    print('Starting scraper at event #%d' % starting_event_ind)
+    with report.stage("scrape"):
+      decklists = scraper.scrape_decks(starting_event_ind, scrape_increment)
     deck_database.add_decklists(decklists)
-    print('Saving...')
-    deck_database.writeout(database_floc)
-    print('Saved!')
-    starting_event_ind += scrape_increment
\ No newline at end of file
+    with report.stage("save"):
+      deck_database.writeout(database_floc, report=report)
+    starting_event_ind += scrape_increment
+    while(len(decklists)>0):
+      with report.stage("scrape"):
+        decklists = scraper.scrape_decks(starting_event_ind, scrape_increment)
+      deck_database.add_decklists(decklists)
+      print('Saving...')
+      with report.stage("save"):
+        deck_database.writeout(database_floc, report=report)
+      print('Saved!')
+      starting_event_ind += scrape_increment
+  except BaseException as e:
+    report.mark_failed(e)
+    raise
+  finally:
+    # write the report for failed runs too
+    report.writeout(report_floc)
\ No newline at end of file
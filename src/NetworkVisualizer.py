@@ -1,17 +1,29 @@
 import networkx as nx
 import json
+import os
 import sys
 from dash import Dash, dcc, html
 import dash_bootstrap_components as dbc
 from dash.dependencies import Output, Input, State
-from MtgTools.GraphHelper import GraphGenerator
+from MtgTools.GraphHelper import GraphGenerator, BucketedRelevance
 from pyvis import network as net
 
 class DashGraphVisualizer:
 
-	def __init__(self, graph, size=1000):
+	def __init__(self, graph, size=1000, buckets=None, min_count=GraphGenerator.default_min_count,
+			min_weight=GraphGenerator.default_min_weight, max_rarity=GraphGenerator.default_max_rarity):
 		self.size = size
 		self.graph = graph
+		self.buckets = buckets
+		self.min_count = min_count
+		self.min_weight = min_weight
+		self.max_rarity = max_rarity
+
+	def get_graph(self, formats=None, start_month=None, end_month=None):
+		if(not self.buckets):
+			return self.graph
+		return self.buckets.get_nx_graph(self.min_count, self.min_weight, self.max_rarity,
+			formats=formats, start_month=start_month, end_month=end_month)
     
 	def sizepx(self):
 		return str(self.size)+"px"
@@ -23,6 +35,8 @@ class DashGraphVisualizer:
 		return n
 
 	def run_app(self, port=8080, host='0.0.0.0'):
+		formats = self.buckets.formats() if self.buckets else []
+		months = self.buckets.months() if self.buckets else []
 		app = Dash("Card Network", external_stylesheets=[dbc.themes.BOOTSTRAP])
 		app.title = "Card relevance network"
 		app.layout = html.Div([
@@ -40,6 +54,23 @@ class DashGraphVisualizer:
                         html.H3("Edge relevance threshold", className="mb-1", style={'textAlign': 'center'}),
                         dbc.ListGroupItem(html.Div(dcc.Slider(0, 1.0, value=0.4,id='weight-slider')))
                     ], style={'width':str(self.size/2)+"px"}),
+                ], className='list-group-horizontal'),
+				dbc.ListGroup([
+                    html.Div([
+                        html.H3("Formats", className="mb-1", style={'textAlign': 'center'}),
+                        dbc.ListGroupItem(dcc.Dropdown(formats, multi=True, id='format-dropdown',
+                                                       disabled=not self.buckets))
+                    ], style={'width':str(self.size/2)+"px"}),
+                    html.Div([
+                        html.H3("From month", className="mb-1", style={'textAlign': 'center'}),
+                        dbc.ListGroupItem(dcc.Dropdown(months, id='start-month-dropdown',
+                                                       disabled=not self.buckets))
+                    ], style={'width':str(self.size/4)+"px"}),
+                    html.Div([
+                        html.H3("To month", className="mb-1", style={'textAlign': 'center'}),
+                        dbc.ListGroupItem(dcc.Dropdown(months, id='end-month-dropdown',
+                                                       disabled=not self.buckets))
+                    ], style={'width':str(self.size/4)+"px"}),
                 ], className='list-group-horizontal'),
 			]),
 			html.Button('Get Subnetwork', id='refresh-button', type="submit", n_clicks=0),
@@ -49,10 +80,16 @@ class DashGraphVisualizer:
 		@app.callback(
 			Output("network-viz", "children"),
 			Input("refresh-button", "n_clicks"),
-			[State("card-name-textbox", "value"),State("weight-slider", "value"),State("k-dropdown", "value")]
+			[State("card-name-textbox", "value"),State("weight-slider", "value"),State("k-dropdown", "value"),
+			 State("format-dropdown", "value"),State("start-month-dropdown", "value"),State("end-month-dropdown", "value")]
 		)
-		def update_output_div(n_clicks, card, weight, k):
-			sg = GraphGenerator.get_subgraph(self.graph, card, K=k, min_weight=weight)
+		def update_output_div(n_clicks, card, weight, k, formats, start_month, end_month):
+			graph = self.get_graph(formats, start_month, end_month)
+			if(graph.number_of_nodes() == 0):
+				return html.P("No cards match the selected formats and months.")
+			if(card not in graph):
+				return html.P("%s is not in the graph for the selected formats and months." % card)
+			sg = GraphGenerator.get_subgraph(graph, card, K=k, min_weight=weight)
 			nt = self.get_showable_network(sg)
 			nt.write_html("net_html.html")
 			return html.Iframe(id="network-viz-frame", srcDoc=nt.html,
@@ -64,7 +101,13 @@ class DashGraphVisualizer:
 if __name__ == "__main__":
 	graph_fname = sys.argv[1]
 	print('Reading %s...' % graph_fname)
-	with open(graph_fname, 'r') as f:
-		graph = nx.node_link_graph(json.load(f))
-	viz = DashGraphVisualizer(graph)
+	if(os.path.isdir(graph_fname)):
+		# bucketed counts from run_bucketed_job; graphs are assembled per query
+		graph = None
+		buckets = BucketedRelevance.from_json(graph_fname)
+	else:
+		with open(graph_fname, 'r') as f:
+			graph = nx.node_link_graph(json.load(f))
+		buckets = None
+	viz = DashGraphVisualizer(graph, buckets=buckets)
 	viz.run_app()
\ No newline at end of file